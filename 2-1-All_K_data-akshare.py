@@ -1,8 +1,14 @@
-import akshare as ak
+import asyncio
+import aiohttp
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import os
 import time
 import datetime
+import multiprocessing
+from queue import Empty
+from concurrent.futures import ProcessPoolExecutor
 
 # ===============================
 # 1. 基本配置
@@ -17,32 +23,43 @@ os.makedirs(CODE_DATA_DIR, exist_ok=True)
 
 CODES_FILE = os.path.join(DATA_DIR, "Ashare_codes_all.csv")
 
-# ===============================
-# 2. 从文件读取股票代码（保留前导0）
-# ===============================
-if not os.path.exists(CODES_FILE):
-    raise FileNotFoundError(f"未找到股票代码文件：{CODES_FILE}")
-
-codes_df = pd.read_csv(CODES_FILE, dtype={"code": str})
-codes = codes_df["code"].tolist()
-print(f"✅ 共读取 {len(codes)} 支股票代码")
+# 保存格式："parquet"（默认）或 "csv"（兼容旧流程）
+SAVE_FORMAT = "parquet"
 
 # ===============================
-# 3. 定义获取 K 线函数（无重试）
+# 2. 定义获取 K 线函数（无重试）
 # ===============================
-def get_kline_data(symbol: str):
+# 直接请求 ak.stock_zh_a_hist 背后的东方财富接口，跳过 akshare 封装
+KLINE_URL = "https://push2his.eastmoney.com/api/qt/stock/kline/get"
+CONCURRENCY = 32  # 所有进程合计同时在途的请求数
+N_WORKERS = os.cpu_count() or 1  # 解析 JSON / 构造 DataFrame 吃 CPU，按核数开进程
+
+async def get_kline_data(symbol: str, session: aiohttp.ClientSession):
     """获取单只股票日线数据（前复权），返回 DataFrame 或 None"""
+    market_code = 1 if symbol.startswith("6") else 0
+    params = {
+        "fields1": "f1,f2,f3,f4,f5,f6",
+        "fields2": "f51,f52,f53,f54,f55,f56",  # 日期,开盘,收盘,最高,最低,成交量
+        "ut": "7eea3edcaed734bea9cbfc24409ed989",
+        "klt": "101",  # 日线
+        "fqt": "1",    # 前复权
+        "secid": f"{market_code}.{symbol}",
+        "beg": "19700101",
+        "end": "20500101",
+    }
     try:
-        df = ak.stock_zh_a_hist(symbol=symbol, period="daily", adjust="qfq")
-        df = df.rename(columns={
-            "日期": "date",
-            "开盘": "open",
-            "收盘": "close",
-            "最高": "high",
-            "最低": "low",
-            "成交量": "volume"
-        })
+        async with session.get(KLINE_URL, params=params) as resp:
+            data_json = await resp.json(content_type=None)
+        data = data_json.get("data") or {}
+        klines = data.get("klines")
+        if not klines:
+            return pd.DataFrame()
+        df = pd.DataFrame(
+            [item.split(",") for item in klines],
+            columns=["date", "open", "close", "high", "low", "volume"]
+        )
         df = df[["date", "open", "high", "low", "close", "volume"]]
+        df[["open", "high", "low", "close", "volume"]] = df[["open", "high", "low", "close", "volume"]].apply(pd.to_numeric)
         df["date"] = pd.to_datetime(df["date"])
         df = df.sort_values("date")
         return df
@@ -50,49 +67,109 @@ def get_kline_data(symbol: str):
         print(f"⚠️ {symbol} 下载失败: {e}")
         return None
 
+def save_k_data(df, filepath: str):
+    """按 SAVE_FORMAT 保存单只股票数据"""
+    if SAVE_FORMAT == "csv":
+        # pyarrow 写 CSV，不带 BOM（读取方都是 pandas，不需要 utf-8-sig）
+        table = pa.Table.from_pandas(df.assign(date=df["date"].dt.date), preserve_index=False)
+        pa_csv.write_csv(table, filepath)
+    else:
+        df.to_parquet(filepath, compression="snappy", index=False)
+
 # ===============================
-# 4. 批量下载（无重试）+ 每次打印总进度
+# 3. 单批下载（子进程内异步并发，无重试）
 # ===============================
-success_count = 0
-fail_count = 0
-skip_count = 0
+progress = None  # 子进程内：汇报每只股票结果的队列，由主进程统一计数打印
 
-total = len(codes)
+async def fetch(code: str, session: aiohttp.ClientSession, sem: asyncio.Semaphore):
+    # 无重试：直接请求一次
+    async with sem:
+        df = await get_kline_data(code, session)
 
-for i, code in enumerate(codes, 1):
-
-    # 判断是否已有文件
-    existing_files = [f for f in os.listdir(CODE_DATA_DIR) if f.startswith(f"Ashare_{code}_")]
-    if existing_files:
-        skip_count += 1
-        print(f"({i}/{total}) ⏩ 跳过 {code}（文件已存在）")
+    # 判断是否成功
+    if df is None or df.empty:
+        progress.put((code, None))
     else:
-        # 无重试：直接请求一次
-        df = get_kline_data(code)
-
-        # 判断是否成功
-        if df is None or df.empty:
-            fail_count += 1
-            print(f"({i}/{total}) ❌ {code} 无数据或下载失败")
-        else:
-            # 构造文件名并保存
-            start_date = df["date"].iloc[0].strftime("%Y%m%d")
-            row_count = len(df)
-            filename = f"Ashare_{code}_{row_count}_{start_date}.csv"
-            filepath = os.path.join(CODE_DATA_DIR, filename)
-            df.to_csv(filepath, index=False, encoding="utf-8-sig")
-
-            success_count += 1
-            print(f"({i}/{total}) ✅ 保存 {filename}")
-
-    # 🔥 每只股票结束后打印总进度
-    print(f"— 当前统计：成功 {success_count} | 失败 {fail_count} | 跳过 {skip_count}\n")
+        # 构造文件名并保存
+        start_date = df["date"].iloc[0].strftime("%Y%m%d")
+        row_count = len(df)
+        filename = f"Ashare_{code}_{row_count}_{start_date}.{SAVE_FORMAT}"
+        filepath = os.path.join(CODE_DATA_DIR, filename)
+        # 写盘放到线程里，事件循环继续处理其他在途请求
+        await asyncio.to_thread(save_k_data, df, filepath)
+        progress.put((code, filename))
+
+async def download_all(codes, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency * 2)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*[fetch(c, session, sem) for c in codes])
+
+def run_batch(codes, concurrency: int, queue):
+    """子进程入口：用独立事件循环下载一批股票，每只的结果 (代码, 文件名或 None) 放入 queue"""
+    global progress
+    progress = queue
+    asyncio.run(download_all(codes, concurrency))
 
 # ===============================
-# 5. 最终统计汇总
+# 4. 主流程：读取代码 → 跳过已有 → 多进程分批下载 → 汇总
 # ===============================
-print("\n🎯 全部股票数据获取完成！")
-print(f"✅ 新获取成功: {success_count} 支股票")
-print(f"⚠️ 下载失败: {fail_count} 支股票")
-print(f"⏩ 已存在跳过: {skip_count} 支股票")
-print("📊 下载结束时间：", datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+if __name__ == "__main__":
+    # 从文件读取股票代码（保留前导0）
+    if not os.path.exists(CODES_FILE):
+        raise FileNotFoundError(f"未找到股票代码文件：{CODES_FILE}")
+
+    codes_df = pd.read_csv(CODES_FILE, dtype={"code": str})
+    codes = codes_df["code"].tolist()
+    print(f"✅ 共读取 {len(codes)} 支股票代码")
+
+    # 只扫描一次目录，之后用集合做 O(1) 判断（旧的 .csv 文件也算已存在）
+    existing = {fn.split("_")[1] for fn in os.listdir(CODE_DATA_DIR)
+                if fn.startswith("Ashare_") and fn.endswith((".parquet", ".csv"))}
+    todo = [c for c in codes if c not in existing]
+    skip_count = len(codes) - len(todo)
+    print(f"⏩ 跳过 {skip_count} 支（文件已存在），待下载 {len(todo)} 支")
+
+    # 交错切分，各批次规模相近；总并发按进程数平分
+    n_workers = max(1, min(N_WORKERS, len(todo)))
+    batches = [todo[i::n_workers] for i in range(n_workers)]
+    per_worker = max(1, CONCURRENCY // n_workers)
+
+    total = len(codes)
+    done_count = skip_count
+    success_count = 0
+    fail_count = 0
+    with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=n_workers) as ex:
+        queue = manager.Queue()
+        futures = [ex.submit(run_batch, batch, per_worker, queue) for batch in batches if batch]
+
+        # 主进程统一计数：每只股票结束都打印总进度
+        while done_count < total:
+            try:
+                code, filename = queue.get(timeout=1)
+            except Empty:
+                if all(fu.done() for fu in futures):
+                    break  # 子进程异常退出，剩余结果不会再来
+                continue
+            done_count += 1
+            if filename is None:
+                fail_count += 1
+                print(f"({done_count}/{total}) ❌ {code} 无数据或下载失败")
+            else:
+                success_count += 1
+                print(f"({done_count}/{total}) ✅ 保存 {filename}")
+            # 🔥 每只股票结束后打印总进度
+            print(f"— 当前统计：成功 {success_count} | 失败 {fail_count} | 跳过 {skip_count}\n")
+
+        for fu in futures:
+            fu.result()  # 子进程里的异常在这里抛出
+
+    # ===============================
+    # 5. 最终统计汇总
+    # ===============================
+    print("\n🎯 全部股票数据获取完成！")
+    print(f"✅ 新获取成功: {success_count} 支股票")
+    print(f"⚠️ 下载失败: {fail_count} 支股票")
+    print(f"⏩ 已存在跳过: {skip_count} 支股票")
+    print("📊 下载结束时间：", datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
@@ -0,0 +1,50 @@
+import pandas as pd
+import os
+
+# ===============================
+# 1. 基本配置
+# ===============================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CODE_DATA_DIR = os.path.join(BASE_DIR, "data", "each_code_k_data")
+
+if not os.path.exists(CODE_DATA_DIR):
+    raise FileNotFoundError(f"未找到数据目录：{CODE_DATA_DIR}")
+
+# ===============================
+# 2. 一次性把已有 CSV 转成 Parquet（snappy 压缩）
+# ===============================
+csv_files = sorted(f for f in os.listdir(CODE_DATA_DIR)
+                   if f.startswith("Ashare_") and f.endswith(".csv"))
+print(f"✅ 共找到 {len(csv_files)} 个 CSV 文件")
+
+success_count = 0
+fail_count = 0
+skip_count = 0
+
+total = len(csv_files)
+
+for i, filename in enumerate(csv_files, 1):
+    csv_path = os.path.join(CODE_DATA_DIR, filename)
+    parquet_path = csv_path[:-len(".csv")] + ".parquet"
+
+    if os.path.exists(parquet_path):
+        skip_count += 1
+        print(f"({i}/{total}) ⏩ 跳过 {filename}（Parquet 已存在）")
+        continue
+
+    try:
+        df = pd.read_csv(csv_path, engine="pyarrow", parse_dates=["date"])
+        df.to_parquet(parquet_path, compression="snappy", index=False)
+        success_count += 1
+        print(f"({i}/{total}) ✅ 转换 {filename}")
+    except Exception as e:
+        fail_count += 1
+        print(f"({i}/{total}) ❌ {filename} 转换失败: {e}")
+
+# ===============================
+# 3. 最终统计汇总
+# ===============================
+print("\n🎯 转换完成！")
+print(f"✅ 转换成功: {success_count} 个文件")
+print(f"⚠️ 转换失败: {fail_count} 个文件")
+print(f"⏩ 已存在跳过: {skip_count} 个文件")
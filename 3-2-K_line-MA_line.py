@@ -1,8 +1,17 @@
 import os
+import threading
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
 import pandas as pd
+import polars as pl
 import plotly.graph_objects as go
+import plotly.io as pio
+from plotly_resampler import FigureResampler
+from plotly_resampler.aggregation import LTTB
 import dash
-from dash import Dash, dcc, html, Input, Output, State
+from dash import Dash, Patch, dcc, html, Input, Output, State
 
 # ===============================
 # 1. 基本路径设置
@@ -14,96 +23,201 @@ CODES_FILE = os.path.join(BASE_DIR, "data", "Ashare_codes_all.csv")
 if not os.path.exists(DATA_DIR):
     raise FileNotFoundError(f"未找到数据目录：{DATA_DIR}")
 
+# 启动时读取一次 {代码: 名称}，回调里直接查字典
+def load_codes_map():
+    if not os.path.exists(CODES_FILE):
+        return {}
+    try:
+        codes_df = pd.read_csv(CODES_FILE, dtype=str)
+        return dict(zip(codes_df["code"], codes_df["name"]))
+    except Exception:
+        return {}
+
+CODES_MAP = load_codes_map()
+
 # ===============================
 # 2. MA 设置（斐波那契均线）
 # ===============================
 MA_WINDOWS = [3, 5, 8, 13, 21, 34, 55]
 
-def add_ma(df, windows=MA_WINDOWS):
-    for w in windows:
-        df[f"MA{w}"] = df["close"].rolling(w).mean()
-    return df
+def add_ma(lf, windows=MA_WINDOWS):
+    # float64 累加避免长序列误差，结果存回 float32；不足窗口为 null（转 pandas 后为 NaN）
+    return lf.with_columns([
+        pl.col("close").cast(pl.Float64).rolling_mean(w).cast(pl.Float32).alias(f"MA{w}")
+        for w in windows
+    ])
 
 # ===============================
 # 3. 读取本地股票数据
 # ===============================
-def load_local_stock_data(symbol: str):
-    files = [f for f in os.listdir(DATA_DIR)
-             if f.startswith(f"Ashare_{symbol}_") and f.endswith(".csv")]
-    if not files:
+def scan_data_dir():
+    """扫描数据目录，返回 {股票代码: 文件名}"""
+    index = {}
+    for fn in sorted(os.listdir(DATA_DIR)):
+        if not fn.startswith("Ashare_"):
+            continue
+        if fn.endswith(".parquet"):
+            index[fn.split("_")[1]] = fn  # 优先使用 Parquet
+        elif fn.endswith(".csv"):
+            index.setdefault(fn.split("_")[1], fn)
+    return index
+
+# 启动时扫描一次，之后按代码直接查表
+FILE_INDEX = scan_data_dir()
+
+def find_stock_file(symbol: str):
+    global FILE_INDEX
+    filename = FILE_INDEX.get(symbol)
+    if filename is None or not os.path.exists(os.path.join(DATA_DIR, filename)):
+        # 未命中或文件已变化（如重新下载），重新扫描一次目录
+        FILE_INDEX = scan_data_dir()
+        filename = FILE_INDEX.get(symbol)
+    if filename is None:
         raise FileNotFoundError(f"未找到股票 {symbol} 的数据文件")
-    filepath = os.path.join(DATA_DIR, files[0])
-    df = pd.read_csv(filepath)
-    df["date"] = pd.to_datetime(df["date"])
-    df = df.sort_values("date").reset_index(drop=True)
-    return df, files[0]
+    return filename
+
+def scan_local_stock_data(symbol: str):
+    """返回 (LazyFrame, 文件名)；只建查询计划，collect 时才真正读取"""
+    filename = find_stock_file(symbol)
+    filepath = os.path.join(DATA_DIR, filename)
+    if filename.endswith(".parquet"):
+        lf = pl.scan_parquet(filepath)
+    else:
+        lf = pl.scan_csv(filepath, try_parse_dates=True)
+    # 价格用 float32 足够画图和算均线，内存减半
+    lf = lf.select(
+        pl.col("date").cast(pl.Datetime("us")),
+        pl.col(["open", "high", "low", "close"]).cast(pl.Float32),
+        pl.col("volume").cast(pl.Int64),
+    ).sort("date")
+    return lf, filename
 
 # ===============================
 # 4. 数据周期聚合
 # ===============================
-def resample_k_data(df, period="daily"):
+def resample_k_data(lf, period="daily"):
     if period == "daily":
-        return df.copy()
-    
-    df_resampled = df.set_index("date").copy()
-    
+        return lf
+
+    # 周期键：周五收尾的周 / 自然月，日期标签取周期最后一天（与 pandas resample("W-FRI"/"ME") 一致）
     if period == "weekly":
-        df_resampled = df_resampled.resample("W-FRI").agg({
-            "open": "first",
-            "high": "max",
-            "low": "min",
-            "close": "last",
-            "volume": "sum"
-        }).dropna().reset_index()
-    elif period == "monthly":
-        df_resampled = df_resampled.resample("ME").agg({
-            "open": "first",
-            "high": "max",
-            "low": "min",
-            "close": "last",
-            "volume": "sum"
-        }).dropna().reset_index()
-    
-    return df_resampled
+        period_end = pl.col("date") + pl.duration(days=(5 - pl.col("date").dt.weekday()) % 7)
+    else:
+        period_end = pl.col("date").dt.month_end()
+
+    return lf.group_by(period_end.alias("period_end"), maintain_order=True).agg(
+        pl.col("open").drop_nulls().first(),
+        pl.col("high").max(),
+        pl.col("low").min(),
+        pl.col("close").drop_nulls().last(),
+        pl.col("volume").sum(),
+    ).select(
+        pl.col("period_end").alias("date"), "open", "high", "low", "close", "volume"
+    ).drop_nulls()
+
+PERIODS = ["daily", "weekly", "monthly"]
+
+# 按 (代码, 文件修改时间) 缓存：读取一次，日/周/月三种周期连同均线一并算好
+@lru_cache(maxsize=128)
+def _load_cached(symbol: str, mtime: float):
+    lf, filename = scan_local_stock_data(symbol)
+    # 三个周期共用同一次扫描，polars 一并优化、多线程执行；画图前才转成 pandas
+    results = pl.collect_all([add_ma(resample_k_data(lf, period)) for period in PERIODS])
+    frames = {period: df.to_pandas() for period, df in zip(PERIODS, results)}
+    return frames, filename
+
+def load_stock_with_ma(symbol: str, period: str = "daily"):
+    filepath = os.path.join(DATA_DIR, find_stock_file(symbol))
+    frames, filename = _load_cached(symbol, os.path.getmtime(filepath))
+    return frames[period], filename
 
 # ===============================
 # 5. 绘制 K线 + MA + 成交量
 # ===============================
+# --- K线：Scattergl（WebGL）画影线 + 实体，替代每根都生成 SVG 节点的 Candlestick ---
+MAX_CANDLES = 1000  # 单次最多下发的 K 线根数
+MIN_BODY = 0.003    # 实体最小高度（占当前价格区间的比例），保证十字星 / 一字板可见
+
+def candle_traces(df, max_candles=MAX_CANDLES):
+    """返回 [涨影线, 涨实体, 跌影线, 跌实体] 四条 trace，每根 K 线 3 个点（两端 + NaN 断开）
+
+    根数超过 max_candles 时把相邻 k 根合并成一根（首开、最高、最低、末收），
+    首次出图和双击复位都只下发 ~max_candles 根；悬停明细由 hover-info 面板在浏览器端显示。
+    """
+    x = df["date"].to_numpy().astype("datetime64[ms]")
+    o, h, l, c = (df[col].to_numpy(dtype=np.float32) for col in ["open", "high", "low", "close"])
+
+    n = len(x)
+    if n > max_candles:
+        k = -(-n // max_candles)
+        starts = np.arange(0, n, k)
+        ends = np.minimum(starts + k, n) - 1
+        x, o, c = x[ends], o[starts], c[ends]
+        h = np.maximum.reduceat(h, starts)
+        l = np.minimum.reduceat(l, starts)
+
+    # 开盘 = 收盘时实体线段长度为 0 画不出来（一字板连影线也没有），上下各撑开半个最小高度
+    half = np.float32(MIN_BODY * (np.nanmax(h) - np.nanmin(l)) / 2) if n else np.float32(0)
+    half = max(half, np.float32(1e-3))
+    flat = o == c
+    body_lo = np.where(flat, o - half, o)
+    body_hi = np.where(flat, c + half, c)
+
+    traces = []
+    for up, color in [(True, "red"), (False, "green")]:
+        m = c > o if up else c <= o
+        xs = np.repeat(x[m], 3)
+        gap = np.full(m.sum(), np.nan, dtype=np.float32)
+        traces.append(go.Scattergl(
+            x=xs, y=np.column_stack([l[m], h[m], gap]).ravel(), mode="lines",
+            line=dict(color=color, width=1), name="K线", legendgroup="K线",
+            showlegend=False, hoverinfo="skip"
+        ))
+        traces.append(go.Scattergl(
+            x=xs, y=np.column_stack([body_lo[m], body_hi[m], gap]).ravel(), mode="lines",
+            line=dict(color=color, width=5), name="K线", legendgroup="K线",
+            showlegend=up, hoverinfo="skip"
+        ))
+    return traces
+
+def visible_slice(df, relayoutdata):
+    """按 relayoutData 的 x 轴范围截取可视区间（两侧各多留一根），范围未变化时返回 None"""
+    if not relayoutdata:
+        return None
+    if relayoutdata.get("xaxis.autorange"):
+        return df
+    rng = relayoutdata.get("xaxis.range") or [relayoutdata.get("xaxis.range[0]"), relayoutdata.get("xaxis.range[1]")]
+    if rng[0] is None or rng[1] is None:
+        return None
+    dates = df["date"].to_numpy()
+    lo = max(np.searchsorted(dates, pd.Timestamp(rng[0]).to_datetime64(), "left") - 1, 0)
+    hi = np.searchsorted(dates, pd.Timestamp(rng[1]).to_datetime64(), "right") + 1
+    return df.iloc[lo:hi]
+
 def create_kline_ma_figure(df, symbol: str, stock_name: str = "😊"):
-    fig = go.Figure()
+    # 长历史只向浏览器发送可视范围内的 ~2000 个点（LTTB 降采样），缩放时按需补点
+    fig = FigureResampler(go.Figure(), default_n_shown_samples=2000, default_downsampler=LTTB())
+    # 直接传 ndarray，省去 plotly 对 pandas Series 的逐列转换
+    x = df["date"].to_numpy().astype("datetime64[ms]")
 
     # --- K线 ---
-    hover_texts = [
-        f"日期: {d.strftime('%Y-%m-%d')}<br>开盘: {o}<br>最高: {h}<br>最低: {l}<br>收盘: {c}"
-        for d, o, h, l, c in zip(df["date"], df["open"], df["high"], df["low"], df["close"])
-    ]
-
-    fig.add_trace(go.Candlestick(
-        x=df["date"],
-        open=df["open"],
-        high=df["high"],
-        low=df["low"],
-        close=df["close"],
-        name="K线",
-        increasing_line_color='red',
-        decreasing_line_color='green',
-        hoverinfo='text',
-        hovertext=hover_texts
-    ))
+    for trace in candle_traces(df):
+        # 不交给 LTTB（会打乱 NaN 断点）；根数由 candle_traces 自行限制，缩放时由 update_resampled 按可视范围重建
+        fig.add_trace(trace, max_n_samples=max(len(trace.x), 1))
 
     # --- 均线 ---
     for col in [f"MA{w}" for w in MA_WINDOWS]:
-        y = df[col] if col in df.columns else [None] * len(df)
-        fig.add_trace(go.Scatter(
-            x=df["date"], y=y, name=col, mode='lines',
+        y = df[col].to_numpy(dtype=np.float32) if col in df.columns else np.full(len(df), np.nan, dtype=np.float32)
+        fig.add_trace(go.Scattergl(
+            x=x, y=y, name=col, mode='lines',
             hovertemplate=f'{col}: %{{y:.2f}}<extra></extra>'
         ))
 
     # --- 成交量柱状图 ---
     if "volume" in df.columns:
-        colors = ["red" if o < c else "green" for o, c in zip(df["open"], df["close"])]
+        colors = np.where(df["open"].to_numpy() < df["close"].to_numpy(), "red", "green")
         fig.add_trace(go.Bar(
-            x=df["date"],
+            x=x,
             y=df["volume"],
             name="成交量",
             marker_color=colors,
@@ -131,12 +245,27 @@ def create_kline_ma_figure(df, symbol: str, stock_name: str = "😊"):
     )
     return fig
 
+# --- 悬停数据：按列打包进 dcc.Store，供浏览器端直接取行 ---
+def build_hover_store(df):
+    data = {"date": df["date"].dt.strftime("%Y-%m-%d").tolist(), "ma_windows": MA_WINDOWS,
+            "volume": df["volume"].tolist()}
+    for col in ["open", "high", "low", "close"] + [f"MA{w}" for w in MA_WINDOWS]:
+        # float32 转 Python float 会带出 2.5199999809265137 这样的尾数，先舍入再下发
+        s = df[col].astype(np.float64).round(4).astype(object)
+        data[col] = s.where(df[col].notna(), None).tolist()
+    return data
+
 # ===============================
 # 6. Dash 页面布局
 # ===============================
 app = Dash(__name__)
 app.title = "A股本地K线浏览器"
 
+# Dash 回调结果经 plotly 的 to_json_plotly 序列化（不走 Flask 的 JSON provider）。
+# plotly 默认 "auto" 在装了 orjson 时已会使用它；这里显式指定只是把 orjson 设为必需依赖，
+# 缺少时启动即报错，而不是静默退回较慢的标准库 json
+pio.json.config.default_engine = "orjson"
+
 app.layout = html.Div([
     html.H2("📈 本地 A股 K线 可视化", style={"textAlign": "center"}),
 
@@ -175,7 +304,9 @@ app.layout = html.Div([
         }
     ),
 
-    dcc.Store(id="selected-period", data="daily")  # 默认日K
+    dcc.Store(id="selected-period", data="daily"),  # 默认日K
+    dcc.Store(id="data-store"),  # 当前股票的行数据 + 均线（悬停用）
+    dcc.Store(id="fig-key")  # 本会话图表在服务端缓存里的键
 ])
 
 # ===============================
@@ -236,105 +367,142 @@ def update_button_style(period):
 # ===============================
 # 10. 更新图表
 # ===============================
+# 每个浏览器会话各自的 (FigureResampler, 数据)，按 fig-key 存放，供缩放回调使用
+# 多个会话同时访问互不干扰；只保留最近 FIG_CACHE_SIZE 张图，旧的自动淘汰
+FIG_CACHE_SIZE = 32
+FIG_CACHE = OrderedDict()
+FIG_CACHE_LOCK = threading.Lock()
+
+def cache_figure(fig, df):
+    key = uuid.uuid4().hex
+    with FIG_CACHE_LOCK:
+        FIG_CACHE[key] = (fig, df)
+        while len(FIG_CACHE) > FIG_CACHE_SIZE:
+            FIG_CACHE.popitem(last=False)
+    return key
+
+def get_cached_figure(key):
+    with FIG_CACHE_LOCK:
+        entry = FIG_CACHE.get(key)
+        if entry is not None:
+            FIG_CACHE.move_to_end(key)
+        return entry
+
 @app.callback(
     Output("kline-graph", "figure"),
     Output("file-info", "children"),
+    Output("data-store", "data"),
+    Output("fig-key", "data"),
     Input("stock-code", "value"),
     Input("selected-period", "data")
 )
 def update_chart(symbol, period):
     if not symbol:
-        return go.Figure(), "请输入股票代码。"
+        # 清空 fig-key：空白图上缩放时不再补丁上一只股票的数据
+        return go.Figure(), "请输入股票代码。", None, None
 
     symbol = symbol.strip().zfill(6)
 
     # 获取股票名称
-    stock_name = "😊"
-    if os.path.exists(CODES_FILE):
-        try:
-            codes_df = pd.read_csv(CODES_FILE, dtype=str)
-            match = codes_df[codes_df["code"] == symbol]
-            if not match.empty:
-                stock_name = match.iloc[0]["name"]
-        except:
-            stock_name = "😊"
+    stock_name = CODES_MAP.get(symbol, "😊")
 
     try:
-        df, filename = load_local_stock_data(symbol)
-        df = resample_k_data(df, period)
-        df = add_ma(df)
+        df, filename = load_stock_with_ma(symbol, period)
         fig = create_kline_ma_figure(df, symbol, stock_name)
-        return fig, f"✅ 数据文件：{filename} （周期: {period}, 共 {len(df)} 行）"
+        return fig, f"✅ 数据文件：{filename} （周期: {period}, 共 {len(df)} 行）", build_hover_store(df), cache_figure(fig, df)
     except Exception as e:
-        return go.Figure(), f"⚠️ 加载失败：{e}"
+        return go.Figure(), f"⚠️ 加载失败：{e}", None, None
+
+# --- 缩放/平移时按可视范围重新降采样（只回传增量） ---
+@app.callback(
+    Output("kline-graph", "figure", allow_duplicate=True),
+    Input("kline-graph", "relayoutData"),
+    State("fig-key", "data"),
+    prevent_initial_call=True
+)
+def update_resampled(relayoutdata, fig_key):
+    entry = get_cached_figure(fig_key) if fig_key else None
+    if entry is None:
+        return dash.no_update
+    fig, df = entry
+    patch = fig.construct_update_data_patch(relayoutdata)
+
+    # K 线只下发可视范围内的部分（fig.data 前 4 条）
+    view = visible_slice(df, relayoutdata)
+    if view is None:
+        return patch
+    if not isinstance(patch, Patch):
+        patch = Patch()
+    for k, trace in enumerate(candle_traces(view)):
+        for key in ("x", "y"):
+            patch["data"][k][key] = trace[key]
+    return patch
 
 # ===============================
 # 11. 悬停显示数据
 # ===============================
-@app.callback(
+# 悬停完全在浏览器端完成：按悬停日期在 data-store 里二分查找行，不再回调 Python
+app.clientside_callback(
+    """
+    function(hoverData, data) {
+        const div = (children, style) =>
+            ({namespace: "dash_html_components", type: "Div", props: {children: children, style: style}});
+        const span = (children, style) =>
+            ({namespace: "dash_html_components", type: "Span", props: {children: children, style: style}});
+
+        if (!hoverData || !hoverData.points) {
+            return div("😊 等待鼠标悬停显示数据", {textAlign: "center", color: "#777"});
+        }
+        if (!data) {
+            return div("😊 无股票代码或本地数据", {textAlign: "center"});
+        }
+
+        // K 线拆成多条 trace、均线又经降采样，pointIndex 不再对应行号，按日期二分查找
+        const x = String(hoverData.points[0].x).slice(0, 10);
+        let lo = 0, hi = data.date.length - 1, i = -1;
+        while (lo <= hi) {
+            const mid = (lo + hi) >> 1;
+            if (data.date[mid] === x) { i = mid; break; }
+            if (data.date[mid] < x) { lo = mid + 1; } else { hi = mid - 1; }
+        }
+        if (i < 0) {
+            return div("😊 无法定位悬停点", {textAlign: "center"});
+        }
+
+        const safe = (val, digits = 2) =>
+            (val === null || val === undefined) ? "—"
+                : (typeof val === "number" ? val.toFixed(digits) : String(val));
+
+        const baseFields = [
+            ["📅 日期", data.date[i] || "—"],
+            ["🟢 开盘", safe(data.open[i])],
+            ["🔴 最高", safe(data.high[i])],
+            ["🔵 最低", safe(data.low[i])],
+            ["🟣 收盘", safe(data.close[i])],
+            ["📊 成交量", safe(data.volume[i], 0)],
+        ];
+        const maFields = data.ma_windows.map(w => ["MA" + w, safe(data["MA" + w][i])]);
+
+        const itemStyle = {minWidth: "80px", textAlign: "center", padding: "0 8px", whiteSpace: "nowrap"};
+        const rowStyle = {display: "flex", justifyContent: "center", alignItems: "center",
+                          flexWrap: "nowrap", overflowX: "auto", padding: "4px 10px"};
+        const makeRow = (fields, labelColor) => div(fields.map(([label, value]) => div([
+            span(label + ": ", {color: labelColor, fontWeight: "bold", marginRight: "4px"}),
+            span(value, {color: "#000"})
+        ], itemStyle)), rowStyle);
+
+        return div([makeRow(baseFields, "#333"), makeRow(maFields, "#555")], {
+            display: "flex", flexDirection: "column", alignItems: "center", justifyContent: "center",
+            background: "#f8f8f8", borderTop: "1px solid #ccc", padding: "6px 0",
+            fontFamily: "monospace", fontSize: "14px", width: "100%"
+        });
+    }
+    """,
     Output("hover-info", "children"),
     Input("kline-graph", "hoverData"),
-    State("stock-code", "value"),
-    State("selected-period", "data")
+    State("data-store", "data")
 )
-def display_hover(hoverData, symbol, period):
-    if not hoverData or "points" not in hoverData:
-        return html.Div("😊 等待鼠标悬停显示数据", style={"textAlign": "center", "color": "#777"})
-    try:
-        if not symbol:
-            return html.Div("😊 无股票代码", style={"textAlign": "center"})
-        sym = symbol.strip().zfill(6)
-        df, _ = load_local_stock_data(sym)
-        df = resample_k_data(df, period)
-        df = add_ma(df)
-    except Exception as e:
-        return html.Div(f"😊 无法加载本地数据：{e}", style={"textAlign": "center"})
 
-    try:
-        points = hoverData["points"]
-        point_index = next((p.get("pointIndex") for p in points if "pointIndex" in p), None)
-        if point_index is None or point_index < 0 or point_index >= len(df):
-            return html.Div("😊 无法定位悬停点", style={"textAlign": "center"})
-
-        row = df.iloc[int(point_index)]
-
-        def safe(val, fmt="{:.2f}"):
-            if pd.isna(val):
-                return "—"
-            try:
-                return fmt.format(val) if isinstance(val, (int, float)) else str(val)
-            except:
-                return str(val)
-
-        date_str = row["date"].strftime("%Y-%m-%d") if not pd.isna(row["date"]) else "—"
-        base_fields = [
-            ("📅 日期", date_str),
-            ("🟢 开盘", safe(row.get("open"))),
-            ("🔴 最高", safe(row.get("high"))),
-            ("🔵 最低", safe(row.get("low"))),
-            ("🟣 收盘", safe(row.get("close"))),
-            ("📊 成交量", safe(row.get("volume"), "{:.0f}")),
-        ]
-
-        ma_fields = [(f"MA{w}", safe(row.get(f"MA{w}"))) for w in MA_WINDOWS]
-
-        item_style = {"minWidth": "80px", "textAlign": "center", "padding": "0 8px", "whiteSpace": "nowrap"}
-        row_style = {"display": "flex", "justifyContent": "center", "alignItems": "center",
-                     "flexWrap": "nowrap", "overflowX": "auto", "padding": "4px 10px"}
-
-        base_row = html.Div([html.Div([html.Span(label+": ", style={"color": "#333", "fontWeight": "bold", "marginRight": "4px"}),
-                                       html.Span(value, style={"color": "#000"})], style=item_style) for label, value in base_fields], style=row_style)
-
-        ma_row = html.Div([html.Div([html.Span(label+": ", style={"color": "#555", "fontWeight": "bold", "marginRight": "4px"}),
-                                     html.Span(value, style={"color": "#000"})], style=item_style) for label, value in ma_fields], style=row_style)
-
-        return html.Div([base_row, ma_row], style={"display": "flex", "flexDirection": "column",
-                                                   "alignItems": "center", "justifyContent": "center",
-                                                   "background": "#f8f8f8", "borderTop": "1px solid #ccc",
-                                                   "padding": "6px 0", "fontFamily": "monospace",
-                                                   "fontSize": "14px", "width": "100%"})
-    except Exception as e:
-        return html.Div(f"😊 数据解析出错：{e}", style={"textAlign": "center"})
 
 # ===============================
 # 12. 启动应用